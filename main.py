@@ -1,8 +1,8 @@
 import asyncio
+import aiohttp
 import logging
 import os
 import argparse
-import random
 import signal
 import sys
 from dotenv import load_dotenv
@@ -15,6 +15,7 @@ from src.crawler import MoneroCrawler
 from src.analyzer import NetworkAnalyzer
 from src.visualizer import NetworkVisualizer
 from src.enricher import DataEnricher 
+from src.utils import scenario_rng
 
 # Configure logging
 logging.basicConfig(
@@ -22,15 +23,12 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-async def inject_seed_data(shutdown_event):
+async def inject_seed_data(storage, shutdown_event):
     """
     Injects synthetic data for portfolio demo.
     Creates a 'Sybil Attack' pattern to ensure graphs look interesting.
     """
     logging.info("💉 Injecting synthetic data for portfolio demo...")
-    storage = StorageManager()
-    await storage.connect()
-    
     await storage.reset_db()
     
     # --- CONFIGURING THE SCENARIO ---
@@ -39,57 +37,44 @@ async def inject_seed_data(shutdown_event):
     sybil_isp = "Malicious Corp Ltd."
     sybil_subnet = "10.66.6" 
     
+    # Own PRNG: SYBIL_SEED replays the exact same scenario
+    rng = scenario_rng()
+
     # Random pools for "Legitimate" traffic
     legit_isps = ["Amazon AWS", "Hetzner Online", "DigitalOcean", "Comcast", "Orange", "Google Cloud"]
     legit_countries = ["US", "DE", "FR", "CN", "NL", "SG", "JP"]
     
     logging.info(f"🎭 Generating {total_nodes} nodes with a {sybil_count}-node Sybil cluster...")
 
-    for i in range(total_nodes):
-        if shutdown_event.is_set(): break 
-        
-        # LOGIC: First 35 nodes are the ATTACKERS. The rest are random victims.
-        if i < sybil_count:
-            # SYBIL NODE (Suspicious Pattern)
-            fake_ip = f"{sybil_subnet}.{i + 1}"
-            isp = sybil_isp
-            country = "XX" # Hiding location
-            asn = "AS66666"
-            version = 9999 
-        else:
-            # LEGITIMATE NODE (Randomized)
-            fake_ip = f"{random.randint(1,220)}.{random.randint(1,255)}.{random.randint(1,255)}.{random.randint(1,255)}"
-            isp = random.choice(legit_isps)
-            country = random.choice(legit_countries)
-            asn = f"AS{random.randint(1000, 90000)}"
-            version = 1
-        
-        node_data = {
-            'ip': fake_ip,
-            'port': 18080,
-            'version': version,
-            'user_agent': f"Monero/v0.18.0.{version}",
-            'asn': asn,
-            'isp': isp,
-            'country': country 
-        }
-        await storage.add_node(node_data)
-        
-        if i % 20 == 0: await asyncio.sleep(0.01)
-    
-    await storage.flush_buffer()
-    await storage.close()
+    # LOGIC: First 35 nodes are the ATTACKERS. The rest are random victims.
+    # SYBIL NODES (Suspicious Pattern): one subnet, one ASN, hidden location, odd version
+    sybil_nodes = [
+        {'ip': f"{sybil_subnet}.{i + 1}", 'port': 18080, 'version': 9999,
+         'user_agent': "Monero/v0.18.0.9999", 'asn': "AS66666", 'isp': sybil_isp, 'country': "XX"}
+        for i in range(sybil_count)
+    ]
+    # LEGITIMATE NODES (Randomized)
+    legit_nodes = [
+        {'ip': f"{rng.randint(1,220)}.{rng.randint(1,255)}.{rng.randint(1,255)}.{rng.randint(1,255)}",
+         'port': 18080, 'version': 1, 'user_agent': "Monero/v0.18.0.1",
+         'asn': f"AS{rng.randint(1000, 90000)}",
+         'isp': rng.choice(legit_isps), 'country': rng.choice(legit_countries)}
+        for _ in range(total_nodes - sybil_count)
+    ]
+
+    if shutdown_event.is_set(): return
+
+    # Whole scenario goes out as a single COPY
+    await storage.add_nodes(sybil_nodes + legit_nodes)
+    await storage.analyze()
     logging.info("✅ Injection Complete: Sybil Scenario Loaded.")
 
-async def run_crawler(duration, shutdown_event):
+async def run_crawler(storage, session, duration, shutdown_event):
     """PHASE 1: CRAWL"""
-    storage = StorageManager()
-    await storage.connect()
-    
     logging.info("🧹 Wiping old data to ensure fresh scan...")
     await storage.reset_db()
     
-    crawler = MoneroCrawler(storage, concurrency=50)
+    crawler = MoneroCrawler(storage, session, concurrency=50)
     crawler_task = asyncio.create_task(crawler.start(duration))
     shutdown_wait = asyncio.create_task(shutdown_event.wait())
     
@@ -109,12 +94,12 @@ async def run_crawler(duration, shutdown_event):
     
     logging.info("💾 Performing final database flush...")
     await storage.flush_buffer() 
-    await storage.close()
+    await storage.analyze()
 
-async def run_enrichment(shutdown_event):
+async def run_enrichment(storage, session, shutdown_event):
     """PHASE 2: ENRICH"""
     logging.info("🧠 Starting Data Enrichment (Resolving ISPs & Countries)...")
-    enricher = DataEnricher()
+    enricher = DataEnricher(session, storage)
     
     enrich_task = asyncio.create_task(enricher.enrich_data())
     shutdown_wait = asyncio.create_task(shutdown_event.wait())
@@ -137,20 +122,20 @@ async def run_enrichment(shutdown_event):
         except Exception as e:
             logging.error(f"❌ Enrichment error: {e}")
 
-async def run_forensics_check(shutdown_event):
+async def run_forensics_check(storage, shutdown_event):
     """PHASE 3: FORENSIC ALERTS"""
     if shutdown_event.is_set(): return
     logging.info("🔍 Running Sybil Detection Engine...")
-    analyzer = NetworkAnalyzer()
+    analyzer = NetworkAnalyzer(storage)
     # Calls the detection method (now properly inside the class)
     await analyzer.detect_sybils()
 
-def generate_report():
-    """PHASE 4: REPORT (Synchronous)"""
+async def generate_report(storage):
+    """PHASE 4: REPORT"""
     logging.info("📊 Starting Analysis Phase...")
-    analyzer = NetworkAnalyzer()
+    analyzer = NetworkAnalyzer(storage)
     
-    data = analyzer.generate_report_data()
+    data = await analyzer.generate_report_data()
     
     if data:
         viz = NetworkVisualizer()
@@ -173,31 +158,47 @@ async def main_pipeline(args):
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, signal_handler)
 
-    # 3. Run Steps Sequence
+    # 3. One connection pool shared by every phase (created once, torn down once)
+    storage = StorageManager()
+    await storage.connect()
+
+    # ...and one HTTP session: pooled keep-alive connections and cached DNS for every phase
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+        limit=200, limit_per_host=10, ttl_dns_cache=300
+    ))
+
+    # 4. Run Steps Sequence
     try:
         # STEP 1: CRAWL
         if args.mock:
-            await inject_seed_data(shutdown_event)
+            await inject_seed_data(storage, shutdown_event)
         elif not args.skip_scan:
             if not shutdown_event.is_set():
-                await run_crawler(args.time, shutdown_event)
+                await run_crawler(storage, session, args.time, shutdown_event)
         else:
             logging.info("⏭️  Skipping Scan (Using existing database)...")
 
         # STEP 2: ENRICH
         # Skip enrichment if we are in mock mode (don't overwrite fake data)
         if not shutdown_event.is_set() and not args.mock:
-            await run_enrichment(shutdown_event)
+            await run_enrichment(storage, session, shutdown_event)
         elif args.mock:
             logging.info("⏭️  Skipping Enrichment (Mock Data is already pre-filled).")
 
         # STEP 3: FORENSICS (The Alert!)
         # Runs on both Mock and Real data
         if not shutdown_event.is_set():
-            await run_forensics_check(shutdown_event)
+            await run_forensics_check(storage, shutdown_event)
+
+        # STEP 4: REPORT (reuses the warm pool)
+        if not args.skip_report:
+            await generate_report(storage)
 
     except asyncio.CancelledError:
         logging.info("🚫 Pipeline Cancelled.")
+    finally:
+        await session.close()
+        await storage.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -221,10 +222,6 @@ if __name__ == "__main__":
 
     try:
         asyncio.run(main_pipeline(args))
-        
-        if not args.skip_report:
-            generate_report()
-            
     except KeyboardInterrupt:
         logging.info("🛑 Hard Exit.")
     except Exception as e:
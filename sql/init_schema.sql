@@ -8,13 +8,18 @@ CREATE TABLE IF NOT EXISTS nodes (
     user_agent VARCHAR(255),
     asn VARCHAR(50),          -- e.g., "AS14061"
     isp_name VARCHAR(255),    -- e.g., "DigitalOcean, LLC"
-    country_code VARCHAR(5)   -- e.g., "US", "DE"
+    country_code VARCHAR(5),  -- e.g., "US", "DE"
+    subnet CIDR               -- /16 network, e.g., "10.66.0.0/16" (NULL for hostnames)
 );
 
 -- Index for fast queries on ASN (finding Sybil clusters)
 CREATE INDEX IF NOT EXISTS idx_nodes_asn ON nodes(asn);
 CREATE INDEX IF NOT EXISTS idx_nodes_country ON nodes(country_code);
 
+-- Indexes for report aggregation (ISP concentration, /16 subnet clustering)
+CREATE INDEX IF NOT EXISTS idx_nodes_isp ON nodes(isp_name);
+CREATE INDEX IF NOT EXISTS idx_nodes_net16 ON nodes(subnet);
+
 -- Table to log historical peer connections
 CREATE TABLE IF NOT EXISTS peer_connections (
     id SERIAL PRIMARY KEY,
@@ -1,93 +1,112 @@
-import pandas as pd
 import logging
 import asyncio
 from src.storage import StorageManager
 
 class NetworkAnalyzer:
-    def __init__(self):
-        self.storage = StorageManager()
+    def __init__(self, storage: StorageManager):
+        # Shares the caller's connected pool; the pipeline owns connect()/close()
+        self.storage = storage
+        self.MIN_CLUSTER_SIZE = 5  # Nodes in one /24 before it is considered a cluster
+        self.MIN_COHESION = 0.8    # Share of the block carrying the same ASN + user agent
 
-    async def fetch_data(self):
-        """Fetches raw data from the database using the StorageManager schema."""
-        await self.storage.connect()
+    async def fetch_aggregates(self):
+        """Aggregates the node table in PostgreSQL; only the top-K rows come back over the wire."""
         try:
             # UPDATED: Using isp_name and country_code from storage.py
-            query = """
-                SELECT ip, port, protocol_version, user_agent, country_code, isp_name 
-                FROM nodes
-            """
-            rows = await self.storage.pool.fetch(query)
-            
-            if not rows:
-                return pd.DataFrame()
-            
-            data = [dict(row) for row in rows]
-            return pd.DataFrame(data)
-            
+            queries = {
+                "total": "SELECT count(*) AS cnt FROM nodes",
+                # Standardize XX/None to Unknown
+                "countries": """
+                    SELECT COALESCE(NULLIF(country_code, 'XX'), 'Unknown') AS label, count(*) AS cnt
+                    FROM nodes GROUP BY 1 ORDER BY 2 DESC LIMIT 15
+                """,
+                "isps": """
+                    SELECT COALESCE(isp_name, 'Unknown ISP') AS label, count(*) AS cnt
+                    FROM nodes GROUP BY 1 ORDER BY 2 DESC LIMIT 10
+                """,
+                # Groups on the precomputed /16 network (e.g., 1.2.0.0); hostnames have none.
+                # Grouping runs on the binary CIDR value, text is formatted only for the top 10.
+                "subnets": """
+                    SELECT host(subnet) AS label, count(*) AS cnt
+                    FROM nodes WHERE subnet IS NOT NULL
+                    GROUP BY subnet ORDER BY 2 DESC LIMIT 10
+                """,
+            }
+            results = await asyncio.gather(*(self.storage.pool.fetch(q) for q in queries.values()))
+            return dict(zip(queries, results))
+
         except Exception as e:
             logging.error(f"❌ Analysis failed: {e}")
-            return pd.DataFrame()
-        finally:
-            await self.storage.close()
+            return None
 
     async def detect_sybils(self):
-        """Identifies ISPs controlling >20% of the network."""
-        await self.storage.connect()
-        try:
-            # Find ISPs hosting more than 20% of your discovered nodes
-            query = """
-                WITH total AS (SELECT count(*) as full_count FROM nodes)
-                SELECT isp_name, count(*) as cnt, 
-                       (count(*)::float / (SELECT full_count FROM total) * 100) as network_percent
+        """
+        Flags /24 blocks where most nodes share one (ASN, user agent) fingerprint.
+        Big providers (AWS, Hetzner) spread over many blocks and versions, so size alone no longer alerts.
+        """
+        query = """
+            WITH fp AS (
+                SELECT network(set_masklen(ip::inet, 24)) AS block, asn, user_agent
                 FROM nodes
-                GROUP BY isp_name
-                HAVING count(*) > 5
-                ORDER BY network_percent DESC;
-            """
-            rows = await self.storage.pool.fetch(query)
-            for row in rows:
-                if row['network_percent'] > 20:
-                    print(f"\n[!] ⚠️  SYBIL ALERT: {row['isp_name']} controls {row['network_percent']:.2f}% of nodes!")
-                    print(f"    Investigate cluster size: {row['cnt']} nodes\n")
-        finally:
-            await self.storage.close()
+                WHERE subnet IS NOT NULL
+            ),
+            blocks AS (
+                SELECT block, count(*) AS size
+                FROM fp
+                GROUP BY block
+                HAVING count(*) >= $1
+            ),
+            fingerprints AS (
+                SELECT fp.block, fp.asn, fp.user_agent, count(*) AS shared,
+                       row_number() OVER (PARTITION BY fp.block ORDER BY count(*) DESC) AS rank
+                FROM fp JOIN blocks USING (block)
+                GROUP BY fp.block, fp.asn, fp.user_agent
+            )
+            SELECT host(b.block) || '/24' AS block, b.size, f.asn, f.user_agent,
+                   f.shared::float / b.size AS cohesion,
+                   b.size::float / (SELECT count(*) FROM nodes) * 100 AS network_percent
+            FROM blocks b
+            JOIN fingerprints f ON f.block = b.block AND f.rank = 1
+            WHERE f.shared::float / b.size >= $2
+            ORDER BY b.size DESC;
+        """
+        rows = await self.storage.pool.fetch(query, self.MIN_CLUSTER_SIZE, self.MIN_COHESION)
+        for row in rows:
+            print(f"\n[!] ⚠️  SYBIL ALERT: {row['size']} nodes in {row['block']} share one fingerprint "
+                  f"({row['asn']} / {row['user_agent']}, {row['cohesion']:.0%} of the block)")
+            print(f"    Cluster holds {row['network_percent']:.2f}% of discovered nodes\n")
 
-    def generate_report_data(self):
-        """Processes the database rows for the visualizer."""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        df = loop.run_until_complete(self.fetch_data())
-        loop.close()
+    async def generate_report_data(self):
+        """Shapes the aggregated database rows for the visualizer."""
+        rows = await self.fetch_aggregates()
 
-        if df.empty:
+        total_nodes = rows["total"][0]["cnt"] if rows else 0
+        if not total_nodes:
             logging.warning("⚠️ No data found in database to analyze.")
             return None
 
-        logging.info(f"📊 Analyzing {len(df)} nodes...")
+        logging.info(f"📊 Analyzing {total_nodes} nodes...")
 
-        # 1. Countries (Standardize XX/None to Unknown)
-        df['country_code'] = df['country_code'].fillna('Unknown')
-        df['country_code'] = df['country_code'].replace('XX', 'Unknown')
-        country_counts = df['country_code'].value_counts().head(15).to_dict()
-
-        # 2. ISPs (The enriched data)
-        df['isp_name'] = df['isp_name'].fillna('Unknown ISP')
-        isp_counts = df['isp_name'].value_counts().head(10).to_dict()
-
-        # 3. Subnet Analysis (Forensic)
-        # Groups by the first two octets (e.g., 1.2.x.x) to find clusters
-        # Ensure IP is stripped before splitting
-        df['subnet'] = df['ip'].str.strip().apply(lambda x: ".".join(x.split('.')[:2]) + ".0.0")
-        subnet_counts = df['subnet'].value_counts().head(10).to_dict()
+        # 1. Countries, 2. ISPs (The enriched data), 3. Subnet Analysis (Forensic)
+        country_counts = {r['label']: r['cnt'] for r in rows["countries"]}
+        isp_counts = {r['label']: r['cnt'] for r in rows["isps"]}
+        subnet_counts = {r['label']: r['cnt'] for r in rows["subnets"]}
 
         # 4. Concentration Data
         # We want to see the share of the top 5 ISPs vs everyone else
-        top_5_isp_total = df['isp_name'].value_counts().head(5).sum()
-        others_total = len(df) - top_5_isp_total
+        top_5_isp_total = sum(list(isp_counts.values())[:5])
+        others_total = total_nodes - top_5_isp_total
         concentration_data = {"Top 5 Providers": int(top_5_isp_total), "Other Providers": int(others_total)}
 
+        # The queries only return the top rows; bucket the rest of the network as "Other"
+        # so shares are read against every node, not just the top-K total
+        for counts in (country_counts, isp_counts):
+            rest = total_nodes - sum(counts.values())
+            if rest > 0:
+                counts["Other"] = rest
+
         return {
-            "total_nodes": len(df),
+            "total_nodes": total_nodes,
             "countries": country_counts,
             "isps": isp_counts,
             "subnets": subnet_counts,
@@ -1,41 +1,92 @@
 import asyncio
 import logging
 import aiohttp
-import os
 import re
+from pathlib import Path
+import socket
+import struct
 from src.storage import StorageManager
-from src.utils import get_geoip_data, get_asn_data, get_version_data
+from src.utils import GeoIPHandler, lookup_data
+
+# Matches "IP:Port" on Monero's P2P port range; compiled once, run over raw bytes
+NODE_RE = re.compile(rb'\b(?:\d{1,3}\.){3}\d{1,3}:1808[0-9]\b')
+
+# One "host[:port]" entry per line of targets.txt (port defaults to 18080).
+# The port is split off the last colon so IPv6 literals survive; "[v6]:port" also works.
+TARGET_RE = re.compile(rb'^[ \t]*(?:\[([0-9A-Fa-f:.]+)\]|([^\s#]*?[^\s#:]))(?::(\d+))?(?:[ \t\r#].*)?$', re.MULTILINE)
+
+async def _connect_any(host, port):
+    """Tries each address the host resolves to (IPv4 or IPv6) until one accepts."""
+    loop = asyncio.get_running_loop()
+    # Literal IPs come straight back; hostnames are resolved off-loop in the default executor
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for family, sock_type, proto, _, addr in infos:
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        try:
+            await loop.sock_connect(sock, addr)
+            return True
+        except OSError:
+            continue
+        finally:
+            sock.close()
+    return False
+
+async def tcp_is_open(host, port, timeout=2.0):
+    """
+    Bare TCP connect probe on a non-blocking socket.
+    Skips the StreamReader/StreamWriter setup of open_connection, and SO_LINGER 0
+    tears the connection down with an immediate RST instead of a FIN handshake.
+    The socket family follows the resolved address, so IPv6-only hostnames still probe.
+    """
+    try:
+        return await asyncio.wait_for(_connect_any(host, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+def parse_targets(data):
+    """Parses raw targets-file bytes into (host, port) tuples; '#' comments and blank lines are skipped."""
+    return [((v6 or host).decode(), int(port) if port else 18080) for v6, host, port in TARGET_RE.findall(data)]
 
 class MoneroCrawler:
-    def __init__(self, storage_manager: StorageManager, concurrency=50):
+    def __init__(self, storage_manager: StorageManager, session: aiohttp.ClientSession, concurrency=50):
         self.storage = storage_manager
+        self.session = session  # Shared pipeline session (warm connections + DNS cache)
         self.concurrency = concurrency
-        self.queue = asyncio.Queue()
+        self.queue = asyncio.Queue()  # Unbounded: enqueue relies on put_nowait
+        self.YIELD_EVERY = 10_000  # Targets enqueued between event-loop yields
         self.seen_ips = set()
         self.active = True
 
+    def enqueue(self, ip, port):
+        """
+        Queues a target unless its IP was already queued this run.
+        Deduplicating here (not in the workers) keeps repeats out of the queue entirely.
+        The queue is unbounded, so put_nowait never raises and no await is needed per target.
+        """
+        if ip in self.seen_ips:
+            return False
+        self.seen_ips.add(ip)
+        self.queue.put_nowait((ip, port))
+        return True
+
     async def load_from_file(self):
         """1. Load nodes from targets.txt"""
-        if os.path.exists('targets.txt'):
-            count = 0
-            with open('targets.txt', 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'): continue
-                    
-                    # Extract IP/Port
-                    if ':' in line:
-                        parts = line.split(':')
-                        ip = parts[0]
-                        try: port = int(parts[1])
-                        except: port = 18080
-                    else:
-                        ip = line
-                        port = 18080
-                    
-                    await self.queue.put((ip, port))
-                    count += 1
-            logging.info(f"📂 Loaded {count} targets from file.")
+        try:
+            # Slurp the file in a worker thread so the event loop never blocks on disk
+            data = await asyncio.to_thread(Path('targets.txt').read_bytes)
+        except FileNotFoundError:
+            return
+
+        count = 0
+        for i, (ip, port) in enumerate(parse_targets(data), 1):
+            if self.enqueue(ip, port):
+                count += 1
+            # Yield now and then so workers can start draining a huge list
+            if i % self.YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        logging.info(f"📂 Loaded {count} targets from file.")
 
     async def fetch_public_nodes(self):
         """2. Load nodes from Web"""
@@ -46,22 +97,28 @@ class MoneroCrawler:
         ]
         headers = {"User-Agent": "Mozilla/5.0"}
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            for url in sources:
-                try:
-                    async with session.get(url, timeout=5) as resp:
-                        text = await resp.text()
-                        # Find all IP:Port patterns
-                        ips = re.findall(r'\b(?:\d{1,3}\.){3}\d{1,3}:1808[0-9]\b', text)
-                        if ips:
-                            logging.info(f"✅ Scraped {len(ips)} nodes from {url}")
-                            for entry in ips:
-                                ip, port = entry.split(':')
-                                await self.queue.put((ip, int(port)))
-                except Exception:
-                    pass
+        for url in sources:
+            try:
+                async with self.session.get(url, headers=headers, timeout=5) as resp:
+                    body = await resp.read()
+                    # Stream IP:Port matches straight off the raw bytes
+                    found = 0
+                    for i, match in enumerate(NODE_RE.finditer(body), 1):
+                        ip, port = match.group().split(b':')
+                        if self.enqueue(ip.decode(), int(port)):
+                            found += 1
+                        if i % self.YIELD_EVERY == 0:
+                            await asyncio.sleep(0)
+                    if found:
+                        logging.info(f"✅ Scraped {found} nodes from {url}")
+            except Exception:
+                pass
 
     async def start(self, duration):
+        # Open (and pre-warm) the GeoIP databases now, not on the first verified node.
+        # Not done at import time: main.py only sets USE_MOCK after importing us.
+        GeoIPHandler()
+
     # Load targets...
         await self.load_from_file()
     
@@ -83,9 +140,7 @@ class MoneroCrawler:
         while self.active:
             try:
                 ip, port = await self.queue.get()
-                if ip not in self.seen_ips:
-                    self.seen_ips.add(ip)
-                    await self.scan_node(ip, port)
+                await self.scan_node(ip, port)
                 self.queue.task_done()
             except asyncio.CancelledError:
                 break
@@ -93,13 +148,13 @@ class MoneroCrawler:
                 self.queue.task_done()
 
     async def scan_node(self, ip, port):
+        if not await tcp_is_open(ip, port):
+            return
+
         try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(ip, port), timeout=2.0
-            )
-            
-            asn_info = get_asn_data(ip)
-            geo_info = get_geoip_data(ip)
+            # The probe never reads the user agent off the wire, so keep the placeholder;
+            # the handler's version may be an invented one from its mock fallback
+            asn_info, geo_info, _ = lookup_data(ip)
             
             node_data = {
                 'ip': ip, 'port': port, 'version': 1,
@@ -108,7 +163,5 @@ class MoneroCrawler:
             }
             await self.storage.add_node(node_data)
             logging.info(f"✅ Verified Node: {ip} [{geo_info}]")
-            writer.close()
-            await writer.wait_closed()
         except:
             pass
\ No newline at end of file
@@ -1,11 +1,66 @@
 import asyncio
 import aiohttp
 import logging
+import time
+from itertools import islice
 from src.storage import StorageManager
+from src.utils import get_local_data
+
+class RateLimiter:
+    """
+    Token bucket driven by a monotonic clock.
+    Allows `rate` acquisitions per `period` seconds, refilling continuously.
+    `burst` caps the bucket; the default of 1 spaces calls evenly, so no sliding
+    window ever sees more than `rate` of them (a full bucket would allow ~2x at startup).
+    """
+    def __init__(self, rate, period, burst=1):
+        self.rate = rate
+        self.period = period
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def defer(self, seconds):
+        """Drains the bucket and blocks acquisitions for `seconds` (server-signalled throttle)."""
+        self.tokens = 0
+        self.updated = time.monotonic() + seconds
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.updated:
+                    await asyncio.sleep(self.updated - now)
+                    continue
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate / self.period)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                # Sleep exactly until the next token is available
+                await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
+
+def chunked(iterable, size):
+    """Yields successive lists of at most `size` items."""
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
 
 class DataEnricher:
-    def __init__(self):
-        self.storage = None 
+    def __init__(self, session: aiohttp.ClientSession, storage: StorageManager = None):
+        self.session = session  # Shared pipeline session (warm connections + DNS cache)
+        self.storage = storage
+        self.BATCH_URL = "http://ip-api.com/batch?fields=status,query,countryCode,isp"
+        self.BATCH_SIZE = 100  # ip-api.com accepts up to 100 IPs per batch POST
+        self.MAX_CONCURRENCY = 5   # In-flight batches at any moment
+        self.REQUESTS_PER_MINUTE = 15  # ip-api.com free tier limit for /batch
+        self.RETRIES_ON_429 = 1  # Re-submits of a throttled batch, after the limiter's pause
+        self.sem = asyncio.BoundedSemaphore(self.MAX_CONCURRENCY)
+        self.limiter = RateLimiter(self.REQUESTS_PER_MINUTE, 60)
 
     async def enrich_data(self):
         if not self.storage:
@@ -14,7 +69,7 @@ class DataEnricher:
 
         # UPDATED: Using the exact column names from your storage.py
         query = """
-            SELECT DISTINCT TRIM(ip) as ip FROM nodes 
+            SELECT ip FROM nodes
             WHERE COALESCE(country_code, '') IN ('', 'XX', 'None', 'Unknown')
                OR COALESCE(isp_name, '') IN ('', 'Unknown', 'Unknown ISP')
         """
@@ -26,44 +81,90 @@ class DataEnricher:
 
         logging.info(f"🧠 Forensic Enricher: Resolving {len(rows)} nodes...")
 
-        async with aiohttp.ClientSession() as session:
-            for i, record in enumerate(rows):
-                ip = record['ip']
-                await self.resolve_ip(session, ip)
-                # Respect API rate limits
-                await asyncio.sleep(1.5) 
+        # Offline pass: the local GeoLite2 databases answer most IPs in microseconds,
+        # so only their misses are sent to ip-api.com.
+        local_records = []
+        ips = []
+        for r in rows:
+            hit = get_local_data(r['ip'])
+            if hit:
+                local_records.append((r['ip'], *hit))
+            else:
+                ips.append(r['ip'])
+
+        if local_records:
+            await self.storage.update_enrichment(local_records)
+            logging.info(f"   📍 Resolved {len(local_records)} nodes from local GeoLite2 databases")
+
+        if not ips:
+            logging.info("✅ Enrichment Cycle Complete.")
+            return
+
+        # Throughput is bounded by the rate limiter, not by per-request round-trips
+        tasks = [asyncio.ensure_future(self.resolve_batch(chunk))
+                 for chunk in chunked(ips, self.BATCH_SIZE)]
+        await asyncio.gather(*tasks)
 
         logging.info("✅ Enrichment Cycle Complete.")
 
-    async def resolve_ip(self, session, ip):
-        clean_ip = ip.strip()
-        url = f"http://ip-api.com/json/{clean_ip}"
-        
+    def honor_rate_headers(self, resp):
+        """Pauses the limiter when ip-api.com reports the window is exhausted (X-Rl / X-Ttl)."""
+        try:
+            remaining = int(resp.headers.get('X-Rl', 1))
+            ttl = int(resp.headers.get('X-Ttl', 0))
+        except ValueError:
+            return
+        if remaining <= 0 or resp.status == 429:
+            # A 429 without X-Ttl still needs a pause; wait out a full window
+            if resp.status == 429 and not ttl:
+                ttl = self.limiter.period
+            logging.warning(f"⏳ ip-api.com rate limit reached, pausing {ttl}s...")
+            self.limiter.defer(ttl)
+
+    async def post_batch(self, payload):
+        """
+        POSTs one batch through the rate limiter and returns the parsed results, or None.
+        A 429 is re-submitted once after the limiter has waited out the server's window.
+        """
+        for _ in range(1 + self.RETRIES_ON_429):
+            await self.limiter.acquire()
+            async with self.session.post(self.BATCH_URL, json=payload, timeout=10) as resp:
+                self.honor_rate_headers(resp)
+                if resp.status == 200:
+                    return await resp.json()
+                logging.warning(f"   ⚠️ ip-api.com returned HTTP {resp.status} for a batch of {len(payload)} IPs")
+                if resp.status != 429:
+                    return None
+        return None
+
+    async def resolve_batch(self, ips):
+        payload = [{"query": ip} for ip in ips]
+
+        async with self.sem:
+            try:
+                results = await self.post_batch(payload)
+            except Exception as e:
+                logging.error(f"   ❌ Batch lookup failed ({len(ips)} IPs): {e}")
+                return
+        if results is None:
+            logging.error(f"   ❌ Batch lookup failed ({len(ips)} IPs left unresolved)")
+            return
+
+        records = []
+        unresolved = 0
+        for data in results:
+            ip = data.get('query')
+            if data.get('status') == 'success':
+                records.append((ip, data.get('countryCode', 'Unknown'), data.get('isp', 'Unknown ISP')))
+            else:
+                # Mark to avoid infinite retries
+                records.append((ip, 'Unknown', 'Private'))
+                unresolved += 1
+
         try:
-            async with session.get(url, timeout=5) as resp:
-                if resp.status != 200: return
-                data = await resp.json()
-                
-                if data.get('status') == 'success':
-                    country = data.get('countryCode', 'Unknown')
-                    isp = data.get('isp', 'Unknown ISP')
-                    
-                    # UPDATED: Mapping to country_code and isp_name
-                    result = await self.storage.pool.execute(
-                        "UPDATE nodes SET country_code = $1, isp_name = $2 WHERE TRIM(ip) = $3", 
-                        country, isp, clean_ip
-                    )
-                    
-                    if result == "UPDATE 1":
-                        logging.info(f"   📍 Fixed: {clean_ip} -> {country}")
-                    else:
-                        logging.error(f"   ❌ DB Mismatch: Could not update {clean_ip}")
-                        
-                else:
-                    # Mark to avoid infinite retries
-                    await self.storage.pool.execute(
-                        "UPDATE nodes SET country_code = 'Unknown', isp_name = 'Private' WHERE TRIM(ip) = $1", 
-                        clean_ip
-                    )
+            updated = await self.storage.update_enrichment(records)
+            if updated != len(records):
+                logging.error(f"   ❌ DB Mismatch: updated {updated} of {len(records)} nodes")
+            logging.info(f"   📍 Fixed {len(records) - unresolved} nodes ({unresolved} unresolvable)")
         except Exception as e:
-            logging.error(f"   ❌ Error for {clean_ip}: {e}")
\ No newline at end of file
+            logging.error(f"   ❌ DB update failed for batch: {e}")
\ No newline at end of file
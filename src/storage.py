@@ -1,11 +1,23 @@
 import os
 import logging
 import asyncpg
+import ipaddress
 from datetime import datetime
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def subnet_of(ip):
+    """
+    Returns the /16 network of an IPv4 address by masking its uint32 form.
+    None for hostnames (.onion/.i2p) and IPv6, which have no /16 to cluster on.
+    """
+    try:
+        addr = int(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return None
+    return ipaddress.IPv4Network((addr & 0xFFFF0000, 16))
+
 class StorageManager:
     """
     Handles asynchronous database interactions using connection pooling and batch processing.
@@ -13,7 +25,8 @@ class StorageManager:
     def __init__(self):
         self.pool = None
         self.node_buffer = []
-        self.BATCH_SIZE = 50  # Flush to DB every 50 nodes found
+        self.BATCH_SIZE = 500  # Flush to DB every 500 nodes found
+        self.NODE_COLUMNS = ['ip', 'port', 'protocol_version', 'user_agent', 'asn', 'isp_name', 'country_code', 'subnet']
         
         # --- SECURE CONFIG LOADING ---
         # We access os.environ inside __init__ so 'self' is valid.
@@ -28,6 +41,9 @@ class StorageManager:
             logging.critical(f"❌ Missing required environment variable: {e}")
             raise RuntimeError("Application cannot start without secure credentials.")
 
+        # Mock data is synthetic and rebuilt every run, so durability can be traded for speed
+        self.use_mock = os.environ.get("USE_MOCK", "False").lower() == "true"
+
     async def connect(self):
         """
         Initializes the connection pool. 
@@ -41,31 +57,120 @@ class StorageManager:
                 host=self.db_host,
                 port=self.db_port,
                 min_size=5,  # Keep 5 connections open
-                max_size=20  # Allow up to 20 during heavy load
+                max_size=20,  # Allow up to 20 during heavy load
+                # Don't wait on the WAL fsync at commit for throwaway mock loads
+                server_settings={'synchronous_commit': 'off' if self.use_mock else 'on'}
             )
             logging.info("🔌 Connected to PostgreSQL database.")
+            await self._ensure_schema()
+            await self._apply_persistence()
         except Exception as e:
             logging.error(f"❌ Database connection failed: {e}")
             raise e
 
-    async def add_node(self, node_data: dict):
+    async def _ensure_schema(self):
         """
-        Buffers a discovered node. Flushes to DB if buffer is full.
-        Expected keys in node_data: ip, port, version, user_agent, asn, isp, country
+        Brings databases initialized from an older schema up to date (subnet column, aggregation indexes).
+        Idempotent, so it is safe to run on every connect.
+        """
+        query = """
+        CREATE INDEX IF NOT EXISTS idx_nodes_isp ON nodes(isp_name);
+        CREATE INDEX IF NOT EXISTS idx_nodes_country ON nodes(country_code);
+        CREATE INDEX IF NOT EXISTS idx_nodes_net16 ON nodes(subnet);
+        """
+        async with self.pool.acquire() as conn:
+            has_subnet = await conn.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'nodes' AND column_name = 'subnet'
+                )
+            """)
+            if not has_subnet:
+                async with conn.transaction():
+                    await conn.execute("ALTER TABLE nodes ADD COLUMN IF NOT EXISTS subnet CIDR")
+                    await self._backfill_subnets(conn)
+            await conn.execute(query)
+
+    async def _backfill_subnets(self, conn):
+        """
+        One-off /16 backfill for rows stored before the subnet column existed, so --skip-scan
+        on an existing volume still clusters. Uses subnet_of, the same rule as ingest.
+        """
+        rows = await conn.fetch("SELECT ip FROM nodes")
+        updates = [(r['ip'], net) for r in rows if (net := subnet_of(r['ip'].strip())) is not None]
+        if not updates:
+            return
+
+        ips, subnets = (list(col) for col in zip(*updates))
+        await conn.execute("""
+            UPDATE nodes SET subnet = v.subnet
+            FROM unnest($1::text[], $2::cidr[]) AS v(ip, subnet)
+            WHERE nodes.ip = v.ip
+        """, ips, subnets)
+        logging.info(f"🧮 Backfilled /16 subnets for {len(updates)} existing nodes.")
+
+    async def _apply_persistence(self):
+        """
+        Switches the tables to UNLOGGED in mock mode (no WAL writes) and back to LOGGED otherwise.
+        Order matters: a logged table may not reference an unlogged one, so
+        peer_connections (which references nodes) flips first going down and last going up.
+        ALTER ... SET [UN]LOGGED takes an ACCESS EXCLUSIVE lock even when it changes nothing,
+        so pg_class.relpersistence is checked first and only tables that need it are altered.
+        """
+        if self.use_mock:
+            target, order = 'u', ('peer_connections', 'nodes')
+        else:
+            target, order = 'p', ('nodes', 'peer_connections')
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT relname, relpersistence FROM pg_class WHERE oid IN (to_regclass('nodes'), to_regclass('peer_connections'))"
+            )
+            current = {r['relname']: r['relpersistence'] for r in rows}
+            for table in order:
+                if current.get(table, target) != target:
+                    await conn.execute(f"ALTER TABLE {table} SET {'UNLOGGED' if self.use_mock else 'LOGGED'};")
+
+    async def analyze(self):
+        """
+        Refreshes planner statistics after a bulk load so GROUP BY queries pick the indexes.
         """
-        self.node_buffer.append((
-            node_data['ip'],
+        async with self.pool.acquire() as conn:
+            await conn.execute("ANALYZE nodes;")
+
+    def _to_record(self, node_data: dict):
+        """Converts a node dict into a row tuple matching NODE_COLUMNS."""
+        # Normalize once at ingest so lookups can hit the PK index without TRIM()
+        ip = node_data['ip'].strip()
+        return (
+            ip,
             node_data['port'],
             node_data.get('version', 0),
             node_data.get('user_agent', 'Unknown'),
             node_data.get('asn', 'Unknown'),
             node_data.get('isp', 'Unknown'),
-            node_data.get('country', 'XX')
-        ))
+            node_data.get('country', 'XX'),
+            subnet_of(ip)
+        )
+
+    async def add_node(self, node_data: dict):
+        """
+        Buffers a discovered node. Flushes to DB if buffer is full.
+        Expected keys in node_data: ip, port, version, user_agent, asn, isp, country
+        """
+        self.node_buffer.append(self._to_record(node_data))
 
         if len(self.node_buffer) >= self.BATCH_SIZE:
             await self.flush_buffer()
 
+    async def add_nodes(self, nodes):
+        """
+        Bulk variant of add_node for pre-built datasets (e.g. the mock scenario).
+        Everything is written in one flush, regardless of BATCH_SIZE.
+        """
+        self.node_buffer.extend(self._to_record(node_data) for node_data in nodes)
+        await self.flush_buffer()
+
     async def flush_buffer(self):
         """
         Writes buffered nodes to the database using an UPSERT strategy.
@@ -74,27 +179,60 @@ class StorageManager:
         if not self.node_buffer:
             return
 
+        # COPY the batch into a staging table, then UPSERT it in a single statement.
+        # DISTINCT ON guards against the same IP appearing twice in one batch,
+        # which ON CONFLICT DO UPDATE would otherwise reject.
         query = """
-        INSERT INTO nodes (ip, port, protocol_version, user_agent, asn, isp_name, country_code, last_seen)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, NOW())
+        INSERT INTO nodes (ip, port, protocol_version, user_agent, asn, isp_name, country_code, subnet, last_seen)
+        SELECT DISTINCT ON (ip) ip, port, protocol_version, user_agent, asn, isp_name, country_code, subnet, NOW()
+        FROM nodes_stage
         ON CONFLICT (ip) DO UPDATE 
         SET 
             last_seen = NOW(),
             protocol_version = EXCLUDED.protocol_version,
             user_agent = EXCLUDED.user_agent,
             asn = EXCLUDED.asn,
-            isp_name = EXCLUDED.isp_name;
+            isp_name = EXCLUDED.isp_name,
+            subnet = EXCLUDED.subnet;
         """
 
         async with self.pool.acquire() as conn:
             try:
-                # executemany is highly optimized for batch inserts in asyncpg
-                await conn.executemany(query, self.node_buffer)
+                async with conn.transaction():
+                    # Created once per pooled connection and emptied at every commit,
+                    # so repeated flushes don't churn the catalog with CREATE/DROP
+                    await conn.execute(
+                        "CREATE TEMP TABLE IF NOT EXISTS nodes_stage (LIKE nodes INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                    )
+                    # COPY protocol: one round-trip, server-side tuple parsing
+                    await conn.copy_records_to_table(
+                        'nodes_stage', records=self.node_buffer, columns=self.NODE_COLUMNS
+                    )
+                    await conn.execute(query)
                 logging.info(f"💾 Flushed {len(self.node_buffer)} nodes to DB.")
                 self.node_buffer = []  # Clear buffer
             except Exception as e:
                 logging.error(f"❌ Failed to write batch: {e}")
 
+    async def update_enrichment(self, records):
+        """
+        Applies resolved (ip, country_code, isp_name) tuples in a single statement.
+        The values are joined in as an unnested set, so each row is matched via the PK index.
+        """
+        if not records:
+            return 0
+
+        ips, countries, isps = (list(col) for col in zip(*records))
+        query = """
+        UPDATE nodes
+        SET country_code = v.cc, isp_name = v.isp
+        FROM unnest($1::text[], $2::text[], $3::text[]) AS v(ip, cc, isp)
+        WHERE nodes.ip = v.ip;
+        """
+        async with self.pool.acquire() as conn:
+            result = await conn.execute(query, ips, countries, isps)
+            return int(result.split()[-1])
+
     async def get_seed_nodes(self, limit=100):
         """
         Retrieves the most recently seen nodes to use as new crawler seeds.
@@ -1,26 +1,33 @@
+import functools
 import logging
 import os
 import random
-import geoip2.database
+import zlib
+import maxminddb
 
 # Pool of innocent ISPs/Countries (Noise)
-MOCK_COUNTRIES = ['FR', 'NL', 'RU', 'SG', 'JP', 'GB', 'CA', 'BR', 'AU', 'IN']
-MOCK_ASNS = [
+MOCK_COUNTRIES = ('FR', 'NL', 'RU', 'SG', 'JP', 'GB', 'CA', 'BR', 'AU', 'IN')
+MOCK_ASNS = (
     "AS16509 (Amazon.com)", 
     "AS13335 (Cloudflare, Inc.)", 
     "AS7922 (Comcast Cable)", 
     "AS20473 (Choopa, LLC)", 
     "AS3320 (Deutsche Telekom AG)", 
     "AS1239 (Sprint)"
-]
-MOCK_VERSIONS = [
+)
+MOCK_VERSIONS = (
     "Monero/0.18.3.1", 
     "Monero/0.18.3.0", 
     "Monero/0.18.2.2", 
     "Monero/0.18.2.0", 
     "Monero/0.17.3.0", 
     "Monero/0.18.0.0"
-]
+)
+
+# Pool sizes hoisted out of the per-IP hot path
+_N_COUNTRY = len(MOCK_COUNTRIES)
+_N_ASN = len(MOCK_ASNS)
+_N_VERSION = len(MOCK_VERSIONS)
 
 # Possible Sybil Scenarios (The "Bad Guy" changes each run)
 SYBIL_PROFILES = [
@@ -30,13 +37,43 @@ SYBIL_PROFILES = [
     {"asn": "AS9009 (M247 Ltd)",             "country": "RO", "version": "Monero/0.18.1.0-Evil"}, 
 ]
 
+# Any routable address works; it only has to walk the tree from the root
+PREWARM_IP = '8.8.8.8'
+
+def scenario_rng():
+    """
+    A private random.Random for synthetic scenarios, seeded from SYBIL_SEED (a decimal integer)
+    so a run can be replayed; OS entropy when the variable is unset or invalid.
+    """
+    seed = os.getenv("SYBIL_SEED")
+    if seed:
+        try:
+            return random.Random(int(seed))
+        except ValueError:
+            logging.warning(f"⚠️ Ignoring non-integer SYBIL_SEED={seed!r}; using a random seed.")
+    return random.Random()
+
+def mock_buckets(ip):
+    """
+    All mock-mode bucket indices for an IP from one CRC32 seed:
+    (is_sybil, asn_index, country_index, version_index).
+    Not memoized itself; lookup_data already caches the finished result per IP.
+    """
+    seed = zlib.crc32(ip.encode())
+    return (seed % 3 == 0,
+            seed % _N_ASN,
+            seed % _N_COUNTRY,
+            seed % _N_VERSION)
+
 class GeoIPHandler:
     _instance = None # Singleton storage
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(GeoIPHandler, cls).__new__(cls)
-            cls._instance.initialize()
+            # Published only once initialize() succeeds, never half-built
+            instance = super(GeoIPHandler, cls).__new__(cls)
+            instance.initialize()
+            cls._instance = instance
         return cls._instance
 
     def initialize(self):
@@ -48,8 +85,10 @@ class GeoIPHandler:
         self.asn_path = 'data/GeoLite2-ASN.mmdb'
 
         # --- DYNAMIC THREAT SELECTION ---
-        # Pick one random attacker profile for this session
-        self.threat_profile = random.choice(SYBIL_PROFILES)
+        # Pick one random attacker profile for this session from the handler's own PRNG
+        # (not the shared global one); set SYBIL_SEED to replay the same scenario
+        self._rng = scenario_rng()
+        self.threat_profile = self._rng.choice(SYBIL_PROFILES)
         
         if self.use_mock:
             logging.info(f"🎰 Generating MOCK Attack Scenario: {self.threat_profile['asn']} | {self.threat_profile['country']} | {self.threat_profile['version']}")
@@ -58,14 +97,14 @@ class GeoIPHandler:
             # Try loading City DB
             if os.path.exists(self.city_path):
                 try:
-                    self.city_reader = geoip2.database.Reader(self.city_path)
+                    self.city_reader = self.open_reader(self.city_path)
                 except Exception as e:
                     logging.warning(f"⚠️ City DB Load Failed: {e}")
             
             # Try loading ASN DB
             if os.path.exists(self.asn_path):
                 try:
-                    self.asn_reader = geoip2.database.Reader(self.asn_path)
+                    self.asn_reader = self.open_reader(self.asn_path)
                 except Exception as e:
                     logging.warning(f"⚠️ ASN DB Load Failed: {e}")
             
@@ -73,60 +112,150 @@ class GeoIPHandler:
             if not self.city_reader and not self.asn_reader:
                 self.use_mock = True
 
-    def get_asn(self, ip):
+            self.prewarm()
+
+        # The mock/real choice is fixed for the life of the process, so each getter is
+        # bound to its branch once here instead of re-testing use_mock/readers per call
+        self.get_asn = self._get_asn_mock if (self.use_mock or not self.asn_reader) else self._get_asn_real
+        self.get_country = self._get_country_mock if (self.use_mock or not self.city_reader) else self._get_country_real
+        self.get_version = self._get_version_mock if self.use_mock else self._get_version_real
+        self.lookup = self._lookup_mock if self.use_mock else self._lookup_real
+
+    def prewarm(self):
+        """
+        Touches each open database once so the search-tree root pages are faulted in
+        up front, rather than on the first real lookup. Bypasses the _record cache.
+        """
+        for reader in (self.asn_reader, self.city_reader):
+            if reader:
+                reader.get(PREWARM_IP)
+
+    def open_reader(self, path):
+        """
+        Opens an mmdb through the libmaxminddb C extension (mmap'd, native tree walk).
+        Falls back to the pure-Python reader only when the extension isn't installed.
+        """
+        try:
+            return maxminddb.open_database(path, mode=maxminddb.MODE_MMAP_EXT)
+        except ValueError:
+            logging.warning("⚠️ libmaxminddb C extension unavailable, using the slower pure-Python reader.")
+            return maxminddb.open_database(path, mode=maxminddb.MODE_MMAP)
+
+    @functools.lru_cache(maxsize=100000)
+    def _record(self, ip):
+        """
+        Walks both databases once per IP and keeps only the two strings we use:
+        (asn_organization, country_iso_code), either of which may be None.
+        Raw maxminddb dicts are plucked directly; no geoip2 model objects are built.
+        """
+        # Misses come back as None (no exception machinery on the hot path);
+        # only a malformed address, e.g. a .onion/.i2p hostname, raises.
+        try:
+            asn_rec = self.asn_reader.get(ip) if self.asn_reader else None
+            city_rec = self.city_reader.get(ip) if self.city_reader else None
+        except ValueError:
+            return None, None
+
+        asn_org = asn_rec.get('autonomous_system_organization') if asn_rec else None
+        country = city_rec.get('country', {}).get('iso_code') if city_rec else None
+        return asn_org, country
+
+    def _get_asn_mock(self, ip):
         """Returns the ISP/ASN String."""
-        if self.use_mock or not self.asn_reader:
-            seed = sum(ord(c) for c in ip)
-            
-            # 33% Chance of being the Selected Sybil Attacker
-            if seed % 3 == 0: 
-                return self.threat_profile['asn']
-                
-            return MOCK_ASNS[seed % len(MOCK_ASNS)]
+        is_sybil, asn_idx, _, _ = mock_buckets(ip)
+        
+        # 33% Chance of being the Selected Sybil Attacker
+        if is_sybil: 
+            return self.threat_profile['asn']
             
-        try:
-            response = self.asn_reader.asn(ip) 
-            return f"{response.autonomous_system_organization}"
-        except:
-            return "Unknown ISP"
+        return MOCK_ASNS[asn_idx]
+
+    def _get_asn_real(self, ip):
+        return self._record(ip)[0] or "Unknown ISP"
 
-    def get_country(self, ip):
+    def _get_country_mock(self, ip):
         """Returns the 2-letter country code."""
-        if self.use_mock or not self.city_reader:
-            seed = sum(ord(c) for c in ip)
-            
-            # CORRELATION LOGIC:
-            if seed % 3 == 0:
-                return self.threat_profile['country']
-                
-            return MOCK_COUNTRIES[seed % len(MOCK_COUNTRIES)]
+        is_sybil, _, country_idx, _ = mock_buckets(ip)
         
-        try:
-            response = self.city_reader.city(ip)
-            return response.country.iso_code or "XX"
-        except:
-            return "XX"
+        # CORRELATION LOGIC:
+        if is_sybil:
+            return self.threat_profile['country']
+            
+        return MOCK_COUNTRIES[country_idx]
 
-    def get_version(self, ip):
+    def _get_country_real(self, ip):
+        return self._record(ip)[1] or "XX"
+
+    def _get_version_mock(self, ip):
         """Returns the User-Agent / Software Version."""
-        if self.use_mock:
-            seed = sum(ord(c) for c in ip)
-            
-            # CORRELATION LOGIC:
-            if seed % 3 == 0:
-                return self.threat_profile['version']
-                
-            return MOCK_VERSIONS[seed % len(MOCK_VERSIONS)]
+        is_sybil, _, _, version_idx = mock_buckets(ip)
+        
+        # CORRELATION LOGIC:
+        if is_sybil:
+            return self.threat_profile['version']
             
+        return MOCK_VERSIONS[version_idx]
+
+    def _get_version_real(self, ip):
         return "Monero/0.18.0.0"
 
+    def _lookup_mock(self, ip):
+        """Returns (asn, country, version) in one pass; all fields come from a single seed."""
+        is_sybil, asn_idx, country_idx, version_idx = mock_buckets(ip)
+        
+        # CORRELATION LOGIC: the attacker profile moves as one unit
+        if is_sybil:
+            threat = self.threat_profile
+            return threat['asn'], threat['country'], threat['version']
+            
+        return MOCK_ASNS[asn_idx], MOCK_COUNTRIES[country_idx], MOCK_VERSIONS[version_idx]
+
+    def _lookup_real(self, ip):
+        return self.get_asn(ip), self.get_country(ip), self.get_version(ip)
+
+    def get_local_record(self, ip):
+        """
+        Returns (country_code, isp) from the local GeoLite2 databases.
+        None when the databases aren't loaded or don't cover the IP.
+        """
+        if self.use_mock or not self.city_reader or not self.asn_reader:
+            return None
+
+        isp, country = self._record(ip)
+        if not country or not isp:
+            return None
+        return country, isp
+
 # --- EXPORTED FUNCTIONS ---
 # These must be at the global level (indentation 0)
+# Memoized per IP: repeat lookups (tight Sybil subnets, re-enrichment) skip the mmdb
+# tree walk entirely. Misses ("Unknown ISP" / "XX" / None) are cached too.
+LOOKUP_CACHE_SIZE = 65536
+
+# The shared handler, held at module level so the hot path is a single global read
+# instead of a GeoIPHandler() call through __new__ and the _instance check
+_handler = None
+
+def _ensure():
+    global _handler
+    if _handler is None:
+        _handler = GeoIPHandler()
+    return _handler
+
+@functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def lookup_data(ip):
+    """(asn, country, version) for an IP; prefer this over the single-field helpers below."""
+    return _ensure().lookup(ip)
+
 def get_geoip_data(ip):
-    return GeoIPHandler().get_country(ip)
+    return lookup_data(ip)[1]
 
 def get_asn_data(ip):
-    return GeoIPHandler().get_asn(ip)
+    return lookup_data(ip)[0]
 
 def get_version_data(ip):
-    return GeoIPHandler().get_version(ip)
\ No newline at end of file
+    return lookup_data(ip)[2]
+
+@functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def get_local_data(ip):
+    return _ensure().get_local_record(ip)
\ No newline at end of file
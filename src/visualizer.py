@@ -1,13 +1,43 @@
+import matplotlib
+# Headless, file-only rendering: pick Agg before pyplot loads so no GUI toolkit is imported
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+import numpy as np
 import logging
 import os
+from xml.sax.saxutils import escape
+
+plt.ioff()
 
 class NetworkVisualizer:
     def __init__(self):
         self.reports_dir = "reports"
+        # zlib level 1 instead of the default 6: several times faster to encode, slightly larger files
+        self.PNG_KWARGS = {'compress_level': 1}
         if not os.path.exists(self.reports_dir):
             os.makedirs(self.reports_dir)
 
+        # Figures are built on first use, then reused by every chart of that kind
+        # (ax.clear() between plots). Pies get their own square canvas.
+        self._figures = {}
+        self._margins = {k: matplotlib.rcParams[f'figure.subplot.{k}'] for k in ('left', 'right', 'bottom', 'top')}
+
+    def _canvas(self, kind, size):
+        """Returns the shared ('bar' or 'pie') figure wiped for the next chart: empty axes, new size, default margins."""
+        if kind not in self._figures:
+            self._figures[kind] = plt.subplots(figsize=size)
+        fig, ax = self._figures[kind]
+        ax.clear()
+        fig.set_size_inches(size)
+        fig.subplots_adjust(**self._margins)
+        return fig, ax
+
+    def close(self):
+        """Releases the shared figures from pyplot once a batch of charts is written."""
+        for fig, _ in self._figures.values():
+            plt.close(fig)
+        self._figures.clear()
+
     def generate_all_charts(self, data):
         """Generates forensics charts based on available data keys."""
         if not data: 
@@ -22,74 +52,92 @@ class NetworkVisualizer:
         if 'isps' in data and data['isps']:
             self.plot_isps(data['isps'])
         
-        # Chart 3: Subnet Clusters
-        if 'subnet' in data and data['subnet']:
-            self.plot_subnets(data['subnet'])
+        # Chart 3: Subnet Clusters (plain SVG, no matplotlib)
+        if 'subnets' in data and data['subnets']:
+            self.plot_subnets_svg(data['subnets'])
             
         # Chart 4: Concentration (Ensure this matches the key in analyzer.py)
         if 'concentration' in data and data['concentration']:
             self.plot_resilience(data['concentration']) # Calling the actual function name
         
+        self.close()
         logging.info(f"✅ 4 Reports generated in '{self.reports_dir}/'")
 
     def plot_countries(self, country_data):
         if not country_data: return
         
-        plt.figure(figsize=(10, 6))
+        fig, ax = self._canvas('bar', (10, 6))
         # Bar chart for countries
-        plt.bar(country_data.keys(), country_data.values(), color='#4e79a7')
-        plt.title('Top Hosting Locations (Monero Nodes)', fontsize=14)
-        plt.xlabel('Country Code', fontsize=12)
-        plt.ylabel('Node Count', fontsize=12)
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
+        ax.bar(list(country_data.keys()), list(country_data.values()), color='#4e79a7')
+        ax.set_title('Top Hosting Locations (Monero Nodes)', fontsize=14)
+        ax.set_xlabel('Country Code', fontsize=12)
+        ax.set_ylabel('Node Count', fontsize=12)
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
         
-        plt.savefig(f"{self.reports_dir}/network_map.png")
-        plt.close()
+        fig.savefig(f"{self.reports_dir}/network_map.png", pil_kwargs=self.PNG_KWARGS)
 
     def plot_isps(self, isp_data):
         """Generates the ISP Breakdown Pie Chart."""
         if not isp_data: return
         
-        plt.figure(figsize=(10, 8))
+        fig, ax = self._canvas('pie', (10, 8))
         # Pie chart for ISPs
-        plt.pie(isp_data.values(), labels=isp_data.keys(), autopct='%1.1f%%', startangle=140)
-        plt.title('Top ISPs / Hosting Providers', fontsize=14)
+        ax.pie(list(isp_data.values()), labels=list(isp_data.keys()), autopct='%1.1f%%', startangle=140)
+        ax.set_title('Top ISPs / Hosting Providers', fontsize=14)
         
-        plt.savefig(f"{self.reports_dir}/top_isps.png")
-        plt.close()
+        fig.savefig(f"{self.reports_dir}/top_isps.png", pil_kwargs=self.PNG_KWARGS)
 
     def plot_versions(self, version_data):
         if not version_data: return
         
-        plt.figure(figsize=(10, 6))
-        plt.barh(list(version_data.keys()), list(version_data.values()), color='#e15759')
-        plt.title('Node Version Distribution', fontsize=14)
-        plt.xlabel('Count')
+        fig, ax = self._canvas('bar', (10, 6))
+        ax.barh(list(version_data.keys()), list(version_data.values()), color='#e15759')
+        ax.set_title('Node Version Distribution', fontsize=14)
+        ax.set_xlabel('Count')
         
-        plt.tight_layout()
-        plt.savefig(f"{self.reports_dir}/versions.png")
-        plt.close()
+        fig.tight_layout()
+        fig.savefig(f"{self.reports_dir}/versions.png", pil_kwargs=self.PNG_KWARGS)
 
-    def plot_subnets(self, subnet_data):
-        """Detects IP clustering for Sybil analysis."""
+    def plot_subnets_svg(self, subnet_data):
+        """
+        Subnet clustering chart emitted as SVG markup, one <rect> per bar.
+        No matplotlib figure or Agg rasterization, and the file scales cleanly in any browser.
+        """
         if not subnet_data: return
-        
-        plt.figure(figsize=(14, 8))
-        sorted_keys = sorted(subnet_data, key=subnet_data.get, reverse=True)
-        sorted_values = [subnet_data[k] for k in sorted_keys]
-        plt.bar(sorted_keys, sorted_values, color='orange', alpha=0.7, edgecolor='black')
-        plt.title('Infrastructure Clustering (IP Subnet Concentration)', fontsize=16, weight='bold')
-        plt.xticks(rotation=45, ha='right', fontsize=10)
-        plt.ylabel('Node Count', fontsize=12)
-        plt.grid(axis='y', linestyle='--', alpha=0.3)
-        plt.subplots_adjust(bottom=0.25)
-        plt.savefig(f"{self.reports_dir}/subnet_clusters.png", bbox_inches='tight', dpi=300)
-        plt.close()
+
+        # Already the top subnets, largest first (ORDER BY ... LIMIT in the analyzer)
+        width, height = 1200, 600
+        left, right, top_pad, bottom = 60, 20, 50, 140
+        plot_w, plot_h = width - left - right, height - top_pad - bottom
+        base = top_pad + plot_h
+        slot = plot_w / len(subnet_data)
+        bar_w = slot * 0.8
+
+        # Scale every bar against the tallest in one vectorized pass
+        counts = np.fromiter(subnet_data.values(), dtype=np.int64, count=len(subnet_data))
+        heights = counts * (plot_h / counts.max())
+
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif">',
+            f'<rect width="{width}" height="{height}" fill="white"/>',
+            f'<text x="{width / 2}" y="30" text-anchor="middle" font-size="20" font-weight="bold">Infrastructure Clustering (IP Subnet Concentration)</text>',
+            f'<text transform="translate(20,{top_pad + plot_h / 2}) rotate(-90)" text-anchor="middle" font-size="13">Node Count</text>',
+            f'<line x1="{left}" y1="{base}" x2="{width - right}" y2="{base}" stroke="black"/>',
+        ]
+        for i, (label, count, h) in enumerate(zip(subnet_data, counts, heights)):
+            x = left + i * slot + (slot - bar_w) / 2
+            cx = x + bar_w / 2
+            parts.append(f'<rect x="{x:.1f}" y="{base - h:.1f}" width="{bar_w:.1f}" height="{h:.1f}" fill="orange" fill-opacity="0.7" stroke="black"/>')
+            parts.append(f'<text x="{cx:.1f}" y="{base - h - 4:.1f}" text-anchor="middle" font-size="11">{count}</text>')
+            parts.append(f'<text transform="translate({cx:.1f},{base + 14}) rotate(-45)" text-anchor="end" font-size="11">{escape(str(label))}</text>')
+        parts.append('</svg>')
+
+        with open(f"{self.reports_dir}/subnet_clusters.svg", "w") as f:
+            f.write("\n".join(parts))
 
     def plot_resilience(self, concentration_data):
         """Visualizes network centralization risk."""
-        plt.figure(figsize=(8, 8))
-        plt.pie(concentration_data.values(), labels=concentration_data.keys(), autopct='%1.1f%%', colors=['#ff9999','#66b3ff'])
-        plt.title('Network Resilience: Provider Dependency', fontsize=14)
-        plt.savefig(f"{self.reports_dir}/network_resilience.png")
-        plt.close()
\ No newline at end of file
+        fig, ax = self._canvas('pie', (8, 8))
+        ax.pie(list(concentration_data.values()), labels=list(concentration_data.keys()), autopct='%1.1f%%', colors=['#ff9999','#66b3ff'])
+        ax.set_title('Network Resilience: Provider Dependency', fontsize=14)
+        fig.savefig(f"{self.reports_dir}/network_resilience.png", pil_kwargs=self.PNG_KWARGS)
\ No newline at end of file